@@ -0,0 +1,300 @@
+# Read-only JSON API over the same queries as the Streamlit app.
+#
+# ETags are derived from table_versions, which is polled every --poll-interval
+# seconds so conditional requests never touch the database. The price is bounded
+# staleness: for up to one poll interval after a write, a client holding the
+# previous ETag still gets a 304 for data that has already changed. If polling
+# fails for more than two intervals, ETags are dropped and every request is served
+# from the database until a poll succeeds again.
+
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import main
+from mysql.connector import pooling
+from main import (
+    DB_CONFIG,
+    CITY_DISTRIBUTION_QUERY,
+    CLAIMS_BY_STATUS_QUERY,
+    EXPIRING_SOON_QUERY,
+    LISTINGS_QUERY,
+    execute_query,
+    initialize_database,
+    listings_filters,
+)
+
+# API configuration
+API_HOST = '0.0.0.0'
+API_PORT = 8502
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+VERSION_POLL_SECONDS = 2
+# Pooled MySQL connections; queries wait for a free one instead of failing
+API_POOL_SIZE = 8
+GZIP_MIN_BYTES = 512
+
+CLAIM_STATUSES = ['Pending', 'Completed', 'Cancelled']
+
+# One slot per pooled connection, the pool itself raises instead of waiting
+pool_slots = threading.BoundedSemaphore(API_POOL_SIZE)
+
+
+def pooled_query(query, params=None):
+    with pool_slots:
+        return execute_query(query, params)
+
+
+def claims_filters(args):
+    status = args.get('status', 'Pending')
+    if status not in CLAIM_STATUSES:
+        raise ValueError(f"status must be one of {', '.join(CLAIM_STATUSES)}")
+    return "", [status]
+
+
+# Endpoint -> query, extra filters, keyset sort keys and the tables its result depends on.
+# Sort keys must be unique together so cursors never skip or repeat rows.
+ENDPOINTS = {
+    '/listings': {
+        'query': LISTINGS_QUERY,
+        'filters': listings_filters,
+        'keys': [('f.expiry_date', 'ASC'), ('f.food_id', 'ASC')],
+        'tables': ['food_listings', 'food_inventory', 'providers'],
+    },
+    '/expiring-soon': {
+        'query': EXPIRING_SOON_QUERY,
+        'keys': [('f.expiry_date', 'ASC'), ('f.food_id', 'ASC')],
+        'tables': ['food_listings', 'food_inventory', 'providers'],
+        # Uses CURDATE(), so the result also changes with the date
+        'daily': True,
+    },
+    '/claims': {
+        'query': CLAIMS_BY_STATUS_QUERY,
+        'filters': claims_filters,
+        'keys': [('c.timestamp', 'ASC'), ('c.claim_id', 'ASC')],
+        'tables': ['claims', 'food_listings', 'providers', 'receivers'],
+    },
+    '/city-distribution': {
+        'query': CITY_DISTRIBUTION_QUERY,
+        'keys': [('total_quantity', 'DESC'), ('city', 'ASC')],
+        'tables': ['food_listings', 'food_inventory', 'providers'],
+        # Keys are aggregates, so the cursor condition goes in HAVING
+        'having': True,
+    },
+}
+
+
+def json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def accepts_gzip(accept_encoding):
+    # An explicit gzip entry wins over '*'; q=0 means the client refuses it
+    qualities = {}
+    for token in accept_encoding.split(','):
+        name, _, params = token.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+    return qualities.get('gzip', qualities.get('*', 0.0)) > 0
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, default=json_default).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    # Only scalars can be bound as query parameters
+    if any(isinstance(value, bool) or not isinstance(value, (str, int, float, type(None))) for value in values):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def keyset_condition(keys, values):
+    # Rows strictly after `values` in the (key1, key2, ...) sort order
+    terms, params = [], []
+    for i, (column, direction) in enumerate(keys):
+        conditions = [f"{previous} = %s" for previous, _ in keys[:i]]
+        conditions.append(f"{column} {'>' if direction == 'ASC' else '<'} %s")
+        terms.append(f"({' AND '.join(conditions)})")
+        params.extend(values[:i + 1])
+    return f"({' OR '.join(terms)})", params
+
+
+def fetch_page(endpoint, args):
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    query = endpoint['query']
+    params = []
+    if 'filters' in endpoint:
+        clause, filter_params = endpoint['filters'](args)
+        query += clause
+        params += filter_params
+
+    keys = endpoint['keys']
+    if args.get('cursor'):
+        condition, cursor_params = keyset_condition(keys, decode_cursor(args['cursor'], len(keys)))
+        query += f" {'HAVING' if endpoint.get('having') else 'AND'} {condition}"
+        params += cursor_params
+
+    query += " ORDER BY " + ", ".join(f"{column} {direction}" for column, direction in keys)
+    query += f" LIMIT {limit + 1}"
+
+    rows = pooled_query(query, tuple(params) if params else None)
+    if rows is None:
+        return None
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][column.split('.')[-1]] for column, _ in keys])
+    return {'data': rows, 'next_cursor': next_cursor}
+
+
+class TableVersions:
+    # Polls table_versions in the background, so ETags can be checked without a query
+
+    def __init__(self, interval=VERSION_POLL_SECONDS):
+        self.interval = interval
+        self.versions = None
+        self.refreshed_at = None
+
+    def refresh(self):
+        rows = pooled_query("SELECT table_name, version FROM table_versions")
+        if rows is not None:
+            # Timestamp first, etag() only reads it once versions is set
+            self.refreshed_at = time.monotonic()
+            self.versions = {row['table_name']: row['version'] for row in rows}
+
+    def poll(self):
+        while True:
+            # A failed poll must not end the thread, the next one may succeed
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Table version poll failed: {e}")
+            time.sleep(self.interval)
+
+    def start(self):
+        self.refresh()
+        threading.Thread(target=self.poll, daemon=True).start()
+
+    def etag(self, endpoint, path, args):
+        versions = self.versions
+        if versions is None:
+            return None
+        # Versions we can no longer vouch for must not turn into 304s
+        if time.monotonic() - self.refreshed_at > 2 * self.interval:
+            return None
+        parts = [path, json.dumps(sorted(args.items()))]
+        parts += [f"{table}:{versions.get(table)}" for table in endpoint['tables']]
+        if endpoint.get('daily'):
+            parts.append(date.today().isoformat())
+        return 'W/"' + hashlib.sha1('|'.join(parts).encode()).hexdigest() + '"'
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, avoid delayed-ACK stalls on keep-alive connections
+    disable_nagle_algorithm = True
+    versions = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        endpoint = ENDPOINTS.get(url.path)
+        if endpoint is None:
+            self.send_json(404, {'error': 'Not found'})
+            return
+
+        args = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        etag = self.versions.etag(endpoint, url.path, args)
+
+        # Unchanged tables: answer from the version cache without touching the database
+        if etag and etag in self.headers.get('If-None-Match', '').replace(' ', '').split(','):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        try:
+            page = fetch_page(endpoint, args)
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+            return
+
+        if page is None:
+            self.send_json(503, {'error': 'Database unavailable'})
+        else:
+            self.send_json(200, page, etag)
+
+    def send_json(self, status, payload, etag=None):
+        body = json.dumps(payload, default=json_default).encode()
+        gzipped = accepts_gzip(self.headers.get('Accept-Encoding', '')) and len(body) >= GZIP_MIN_BYTES
+        if gzipped:
+            body = gzip.compress(body, compresslevel=5)
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Cache-Control', 'no-cache')
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def run_api(host=API_HOST, port=API_PORT, poll_interval=VERSION_POLL_SECONDS):
+    if not initialize_database():
+        raise SystemExit("Failed to initialize database. Please check your MySQL connection.")
+
+    # Reuse connections across requests instead of connecting per query
+    main.connection_pool = pooling.MySQLConnectionPool(pool_name='api', pool_size=API_POOL_SIZE, **DB_CONFIG)
+
+    ApiHandler.versions = TableVersions(poll_interval)
+    ApiHandler.versions.start()
+
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    print(f"Serving food wastage API on http://{host}:{port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read-only JSON API for the food wastage database")
+    parser.add_argument('--host', default=API_HOST)
+    parser.add_argument('--port', type=int, default=API_PORT)
+    parser.add_argument('--poll-interval', type=float, default=VERSION_POLL_SECONDS,
+                        help="Seconds between table version polls, the longest a 304 can be stale")
+    options = parser.parse_args()
+    run_api(options.host, options.port, options.poll_interval)
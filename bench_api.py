@@ -0,0 +1,73 @@
+import argparse
+import http.client
+import statistics
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlparse
+
+# Benchmark for api.py: start the API first, then run e.g.
+#   python bench_api.py --url http://localhost:8502/listings --requests 5000 --concurrency 16
+
+
+def worker(url, count, conditional, latencies, statuses):
+    # One keep-alive connection per worker, like a scraper reusing its session
+    connection = http.client.HTTPConnection(url.hostname, url.port or 80)
+    path = url.path + (f"?{url.query}" if url.query else "")
+    headers = {'Accept-Encoding': 'gzip'}
+
+    if conditional:
+        connection.request('GET', path, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        if response.getheader('ETag'):
+            headers['If-None-Match'] = response.getheader('ETag')
+
+    for _ in range(count):
+        start = time.perf_counter()
+        connection.request('GET', path, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        statuses.append(response.status)
+    connection.close()
+
+
+def run_benchmark(url, total, concurrency, conditional):
+    latencies, statuses = [], []
+    # Spread the remainder so exactly `total` requests are sent
+    counts = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+    threads = [
+        threading.Thread(target=worker, args=(url, count, conditional, latencies, statuses))
+        for count in counts
+    ]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    label = "conditional (If-None-Match)" if conditional else "full responses"
+    print(f"{label}: {len(latencies) / elapsed:.0f} requests/sec, "
+          f"p50 {statistics.median(latencies) * 1000:.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms, "
+          f"statuses {dict(sorted(Counter(statuses).items()))}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure requests/sec of the food wastage API on one node")
+    parser.add_argument('--url', default='http://localhost:8502/listings')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    options = parser.parse_args()
+    if options.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if options.requests < options.concurrency:
+        parser.error("--requests must be at least --concurrency")
+
+    target = urlparse(options.url)
+    run_benchmark(target, options.requests, options.concurrency, conditional=False)
+    run_benchmark(target, options.requests, options.concurrency, conditional=True)
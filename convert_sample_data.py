@@ -0,0 +1,95 @@
+import os
+import sys
+import pandas as pd
+import pyarrow as pa
+
+from main import (
+    SAMPLE_BATCH_ROWS,
+    SAMPLE_DATA_DIR,
+    SAMPLE_SOURCE_HASH_KEY,
+    SAMPLE_TABLES,
+    file_sha256,
+    sample_data_path,
+)
+
+# Source formats of the typed CSV columns
+DATE_FORMAT = '%m/%d/%Y'
+TIMESTAMP_FORMAT = '%m/%d/%Y %H:%M'
+
+# (table, column) -> (referenced table, referenced column)
+FOREIGN_KEYS = {
+    ('food_listings', 'provider_id'): ('providers', 'provider_id'),
+    ('claims', 'food_id'): ('food_listings', 'food_id'),
+    ('claims', 'receiver_id'): ('receivers', 'receiver_id'),
+}
+
+
+def normalize_column(values, arrow_type):
+    # Parse one CSV column into its typed form, returning (values, invalid row mask)
+    if pa.types.is_integer(arrow_type):
+        parsed = pd.to_numeric(values, errors='coerce')
+        invalid = parsed.isna() | (parsed % 1 != 0)
+        return parsed.where(~invalid, 0).astype('int64'), invalid
+    if pa.types.is_date(arrow_type):
+        parsed = pd.to_datetime(values, format=DATE_FORMAT, errors='coerce')
+        return parsed.dt.date, parsed.isna()
+    if pa.types.is_timestamp(arrow_type):
+        parsed = pd.to_datetime(values, format=TIMESTAMP_FORMAT, errors='coerce')
+        return parsed, parsed.isna()
+    values = values.str.strip()
+    return values, values == ''
+
+
+def convert_table(table):
+    csv_file, columns = SAMPLE_TABLES[table]
+    df = pd.read_csv(csv_file, dtype=str, keep_default_na=False)
+
+    missing = [csv_column for csv_column, _, _ in columns if csv_column not in df.columns]
+    if missing:
+        raise ValueError(f"{csv_file}: missing columns {', '.join(missing)}")
+
+    arrays = {}
+    for csv_column, db_column, arrow_type in columns:
+        values, invalid = normalize_column(df[csv_column], arrow_type)
+        if invalid.any():
+            # Report CSV line numbers, counting the header
+            lines = ', '.join(str(i + 2) for i in df.index[invalid][:10])
+            raise ValueError(f"{csv_file}: invalid {csv_column} values on lines {lines}")
+        arrays[db_column] = pa.array(values, type=arrow_type)
+
+    data = pa.table(arrays)
+    key = columns[0][1]
+    if len(pd.unique(data[key].to_numpy())) != len(data):
+        raise ValueError(f"{csv_file}: duplicate {columns[0][0]} values")
+
+    # Lets the loader tell whether the file still matches its CSV
+    return data.replace_schema_metadata({SAMPLE_SOURCE_HASH_KEY: file_sha256(csv_file)})
+
+
+def check_foreign_keys(tables):
+    for (table, column), (ref_table, ref_column) in FOREIGN_KEYS.items():
+        known = set(tables[ref_table][ref_column].to_pylist())
+        dangling = sorted(set(tables[table][column].to_pylist()) - known)
+        if dangling:
+            raise ValueError(f"{table}.{column}: no matching {ref_table} for {dangling[:10]}")
+
+
+def convert_sample_data():
+    tables = {table: convert_table(table) for table in SAMPLE_TABLES}
+    check_foreign_keys(tables)
+
+    os.makedirs(SAMPLE_DATA_DIR, exist_ok=True)
+    for table, data in tables.items():
+        # Uncompressed Arrow IPC files can be memory-mapped without copying
+        with pa.OSFile(sample_data_path(table), 'wb') as sink:
+            with pa.ipc.new_file(sink, data.schema) as writer:
+                writer.write_table(data, max_chunksize=SAMPLE_BATCH_ROWS)
+        print(f"{table}: {data.num_rows} rows -> {sample_data_path(table)}")
+
+
+if __name__ == "__main__":
+    try:
+        convert_sample_data()
+    except (OSError, ValueError) as e:
+        print(f"Conversion failed: {e}", file=sys.stderr)
+        sys.exit(1)
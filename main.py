@@ -4,8 +4,11 @@ import mysql.connector
 import plotly.express as px
 from datetime import datetime
 from mysql.connector import Error
+import hashlib
+import os
 import re
 import numpy as np
+import pyarrow as pa
 
 # Database configuration
 DB_CONFIG = {
@@ -15,6 +18,108 @@ DB_CONFIG = {
     'database': 'food_wastage_management'
 }
 
+# Columnar sample data, produced from the CSV seeds by convert_sample_data.py
+SAMPLE_DATA_DIR = 'sample_data'
+
+# Rows per record batch in the Arrow files, and per multi-row INSERT when loading them
+SAMPLE_BATCH_ROWS = 1000
+
+# Seed tables in load order: (csv file, [(csv column, db column, arrow type)])
+SAMPLE_TABLES = {
+    'providers': ('providers_data.csv', [
+        ('Provider_ID', 'provider_id', pa.int32()),
+        ('Name', 'name', pa.string()),
+        ('Type', 'type', pa.string()),
+        ('Address', 'address', pa.string()),
+        ('City', 'city', pa.string()),
+        ('Contact', 'contact', pa.string()),
+    ]),
+    'receivers': ('receivers_data.csv', [
+        ('Receiver_ID', 'receiver_id', pa.int32()),
+        ('Name', 'name', pa.string()),
+        ('Type', 'type', pa.string()),
+        ('City', 'city', pa.string()),
+        ('Contact', 'contact', pa.string()),
+    ]),
+    'food_listings': ('food_listings_data.csv', [
+        ('Food_ID', 'food_id', pa.int32()),
+        ('Food_Name', 'food_name', pa.string()),
+        ('Quantity', 'quantity', pa.int32()),
+        ('Expiry_Date', 'expiry_date', pa.date32()),
+        ('Provider_ID', 'provider_id', pa.int32()),
+        ('Provider_Type', 'provider_type', pa.string()),
+        ('Location', 'location', pa.string()),
+        ('Food_Type', 'food_type', pa.string()),
+        ('Meal_Type', 'meal_type', pa.string()),
+    ]),
+    'claims': ('claims_data.csv', [
+        ('Claim_ID', 'claim_id', pa.int32()),
+        ('Food_ID', 'food_id', pa.int32()),
+        ('Receiver_ID', 'receiver_id', pa.int32()),
+        ('Status', 'status', pa.string()),
+        ('Timestamp', 'timestamp', pa.timestamp('s')),
+    ]),
+}
+
+
+def sample_data_path(table):
+    return os.path.join(SAMPLE_DATA_DIR, f"{table}.arrow")
+
+# Arrow schema metadata key holding the SHA-256 of the CSV a file was converted from
+SAMPLE_SOURCE_HASH_KEY = b'source_sha256'
+
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def columnar_sample_data_current():
+    # Arrow files exist and were converted from the current CSV seeds (mtimes are not
+    # reliable, git does not preserve them)
+    for table, (csv_file, _) in SAMPLE_TABLES.items():
+        path = sample_data_path(table)
+        if not os.path.exists(path):
+            return False
+        if not os.path.exists(csv_file):
+            continue
+
+        with pa.memory_map(path) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+        if metadata.get(SAMPLE_SOURCE_HASH_KEY, b'').decode() != file_sha256(csv_file):
+            st.warning(f"{path} was not converted from the current {csv_file}, loading the CSV seeds. "
+                       "Run convert_sample_data.py to refresh the columnar files.")
+            return False
+    return True
+
+# Tables whose writes bump their row in table_versions
+VERSIONED_TABLES = ['providers', 'receivers', 'food_listings', 'claims', 'food_inventory']
+
+def create_trigger_if_missing(cursor, name, definition):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.triggers WHERE trigger_schema = DATABASE() AND trigger_name = %s",
+        (name,)
+    )
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"CREATE TRIGGER {name} {definition}")
+
+def add_column_if_missing(cursor, table, column, definition):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.columns WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+        (table, column)
+    )
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        return True
+    return False
+
+def backfill_claim_quantities(cursor):
+    # Claims from before the ledger (and the seed data) took the whole listing
+    cursor.execute("""
+        UPDATE claims c
+        JOIN food_listings f ON c.food_id = f.food_id
+        SET c.quantity = f.quantity
+        WHERE NOT EXISTS (SELECT 1 FROM inventory_ledger l WHERE l.claim_id = c.claim_id)
+    """)
+
 def convert_date_format(date_str):
     try:
         # Handle various date formats including single-digit months/days
@@ -43,6 +148,15 @@ def convert_date_format(date_str):
         st.error(f"Date conversion error for '{date_str}': {e}")
         return datetime.now().strftime('%Y-%m-%d')
 
+def convert_timestamp_format(timestamp_str):
+    # Keep the time of day, matching the columnar sample data
+    for fmt in ['%m/%d/%Y %H:%M', '%m/%d/%Y %H:%M:%S']:
+        try:
+            return datetime.strptime(timestamp_str, fmt).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            continue
+    return convert_date_format(timestamp_str) + " 00:00:00"
+
 def initialize_database():
     try:
         connection = mysql.connector.connect(
@@ -97,12 +211,104 @@ def initialize_database():
                 claim_id INT PRIMARY KEY,
                 food_id INT NOT NULL,
                 receiver_id INT NOT NULL,
+                quantity INT NOT NULL DEFAULT 1,
                 status VARCHAR(20) NOT NULL,
                 timestamp DATETIME NOT NULL,
                 FOREIGN KEY (food_id) REFERENCES food_listings(food_id),
                 FOREIGN KEY (receiver_id) REFERENCES receivers(receiver_id)
             )
         """)
+        quantity_added = add_column_if_missing(cursor, 'claims', 'quantity', "INT NOT NULL DEFAULT 1 AFTER receiver_id")
+
+        # Append-only inventory ledger, the source of truth for reservations
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS inventory_ledger (
+                entry_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                food_id INT NOT NULL,
+                claim_id INT,
+                event ENUM('reserve', 'release', 'consume') NOT NULL,
+                quantity INT NOT NULL,
+                created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                INDEX (food_id),
+                INDEX (claim_id)
+            )
+        """)
+        if quantity_added:
+            backfill_claim_quantities(cursor)
+
+        # Materialized available quantities, rebuildable from the ledger
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS food_inventory (
+                food_id INT PRIMARY KEY,
+                available_quantity INT NOT NULL
+            )
+        """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS inventory_totals (
+                counter_name VARCHAR(50) PRIMARY KEY,
+                value BIGINT NOT NULL
+            )
+        """)
+
+        # A listing can not shrink below the units its claims hold, whatever writes it.
+        # The locking read sees the latest committed counter, which is quantity minus
+        # the units the ledger holds reserved or consumed.
+        create_trigger_if_missing(cursor, "food_listings_guard_quantity", """
+            BEFORE UPDATE ON food_listings FOR EACH ROW
+            BEGIN
+                DECLARE available INT;
+                SELECT available_quantity INTO available FROM food_inventory
+                WHERE food_id = OLD.food_id FOR UPDATE;
+                IF available + NEW.quantity - OLD.quantity < 0 THEN
+                    SIGNAL SQLSTATE '45000'
+                    SET MESSAGE_TEXT = 'Quantity is below the units already claimed for this listing';
+                END IF;
+            END
+        """)
+
+        # Keep the counters in step with listing quantities, whatever writes them
+        create_trigger_if_missing(cursor, "food_listings_insert_inventory", """
+            AFTER INSERT ON food_listings FOR EACH ROW
+            BEGIN
+                INSERT INTO food_inventory (food_id, available_quantity) VALUES (NEW.food_id, NEW.quantity);
+                UPDATE inventory_totals SET value = value + NEW.quantity WHERE counter_name = 'available';
+            END
+        """)
+        create_trigger_if_missing(cursor, "food_listings_update_inventory", """
+            AFTER UPDATE ON food_listings FOR EACH ROW
+            BEGIN
+                UPDATE food_inventory
+                SET food_id = NEW.food_id, available_quantity = available_quantity + NEW.quantity - OLD.quantity
+                WHERE food_id = OLD.food_id;
+                UPDATE inventory_totals SET value = value + NEW.quantity - OLD.quantity WHERE counter_name = 'available';
+            END
+        """)
+        create_trigger_if_missing(cursor, "food_listings_delete_inventory", """
+            AFTER DELETE ON food_listings FOR EACH ROW
+            BEGIN
+                UPDATE inventory_totals
+                SET value = value - COALESCE((SELECT available_quantity FROM food_inventory WHERE food_id = OLD.food_id), 0)
+                WHERE counter_name = 'available';
+                DELETE FROM food_inventory WHERE food_id = OLD.food_id;
+            END
+        """)
+
+        # Per-table change counters, bumped by triggers and used for API ETags
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS table_versions (
+                table_name VARCHAR(64) PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0
+            )
+        """)
+
+        for table in VERSIONED_TABLES:
+            cursor.execute("INSERT IGNORE INTO table_versions (table_name) VALUES (%s)", (table,))
+            for event in ['INSERT', 'UPDATE', 'DELETE']:
+                create_trigger_if_missing(cursor, f"{table}_{event.lower()}_version", f"""
+                    AFTER {event} ON {table} FOR EACH ROW
+                    UPDATE table_versions SET version = version + 1 WHERE table_name = '{table}'
+                """)
 
         connection.commit()
 
@@ -113,6 +319,11 @@ def initialize_database():
                 load_sample_data(connection)
                 break
 
+        # First run with the ledger: build the counters from the existing listings
+        cursor.execute("SELECT COUNT(*) FROM inventory_totals")
+        if cursor.fetchone()[0] == 0:
+            rebuild_inventory_counters(connection)
+
         cursor.close()
         connection.close()
         return True
@@ -124,47 +335,12 @@ def load_sample_data(connection):
     try:
         cursor = connection.cursor()
 
-        # Load providers data
-        providers_df = pd.read_csv('providers_data.csv')
-        for _, row in providers_df.iterrows():
-            cursor.execute(
-                "INSERT INTO providers (provider_id, name, type, address, city, contact) VALUES (%s, %s, %s, %s, %s, %s)",
-                (row['Provider_ID'], row['Name'], row['Type'], row['Address'], row['City'], row['Contact'])
-            )
-
-        # Load receivers data
-        receivers_df = pd.read_csv('receivers_data.csv')
-        for _, row in receivers_df.iterrows():
-            cursor.execute(
-                "INSERT INTO receivers (receiver_id, name, type, city, contact) VALUES (%s, %s, %s, %s, %s)",
-                (row['Receiver_ID'], row['Name'], row['Type'], row['City'], row['Contact'])
-            )
-
-        # Load food listings data
-        food_listings_df = pd.read_csv('food_listings_data.csv')
-        for _, row in food_listings_df.iterrows():
-            # Convert expiry_date
-            expiry_date = convert_date_format(str(row['Expiry_Date']))
-
-            cursor.execute(
-                """INSERT INTO food_listings 
-                (food_id, food_name, quantity, expiry_date, provider_id, provider_type, location, food_type, meal_type) 
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)""",
-                (row['Food_ID'], row['Food_Name'], row['Quantity'], expiry_date,
-                 row['Provider_ID'], row['Provider_Type'], row['Location'],
-                 row['Food_Type'], row['Meal_Type'])
-            )
-
-        # Load claims data
-        claims_df = pd.read_csv('claims_data.csv')
-        for _, row in claims_df.iterrows():
-            # Convert timestamp
-            timestamp = convert_date_format(str(row['Timestamp'])) + " 00:00:00"
-
-            cursor.execute(
-                "INSERT INTO claims (claim_id, food_id, receiver_id, status, timestamp) VALUES (%s, %s, %s, %s, %s)",
-                (row['Claim_ID'], row['Food_ID'], row['Receiver_ID'], row['Status'], timestamp)
-            )
+        # Prefer the pre-converted columnar files, they skip CSV parsing and date conversion
+        if columnar_sample_data_current():
+            load_columnar_sample_data(cursor)
+        else:
+            load_csv_sample_data(cursor)
+        backfill_claim_quantities(cursor)
 
         connection.commit()
         st.success("Data loaded successfully!")
@@ -175,9 +351,78 @@ def load_sample_data(connection):
         cursor.close()
 
 
+def load_columnar_sample_data(cursor):
+    for table, (_, columns) in SAMPLE_TABLES.items():
+        db_columns = [db_column for _, db_column, _ in columns]
+        query = (f"INSERT INTO {table} ({', '.join(db_columns)}) "
+                 f"VALUES ({', '.join(['%s'] * len(db_columns))})")
+
+        # Memory-map the Arrow file (no CSV parsing or date conversion) and insert it
+        # one chunk at a time, so each multi-row INSERT stays under max_allowed_packet
+        with pa.memory_map(sample_data_path(table)) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i).select(db_columns)
+                for offset in range(0, batch.num_rows, SAMPLE_BATCH_ROWS):
+                    chunk = batch.slice(offset, SAMPLE_BATCH_ROWS)
+                    rows = list(zip(*(column.to_pylist() for column in chunk.columns)))
+                    cursor.executemany(query, rows)
+
+
+def load_csv_sample_data(cursor):
+    # Load providers data
+    providers_df = pd.read_csv('providers_data.csv')
+    for _, row in providers_df.iterrows():
+        cursor.execute(
+            "INSERT INTO providers (provider_id, name, type, address, city, contact) VALUES (%s, %s, %s, %s, %s, %s)",
+            (row['Provider_ID'], row['Name'], row['Type'], row['Address'], row['City'], row['Contact'])
+        )
+
+    # Load receivers data
+    receivers_df = pd.read_csv('receivers_data.csv')
+    for _, row in receivers_df.iterrows():
+        cursor.execute(
+            "INSERT INTO receivers (receiver_id, name, type, city, contact) VALUES (%s, %s, %s, %s, %s)",
+            (row['Receiver_ID'], row['Name'], row['Type'], row['City'], row['Contact'])
+        )
+
+    # Load food listings data
+    food_listings_df = pd.read_csv('food_listings_data.csv')
+    for _, row in food_listings_df.iterrows():
+        # Convert expiry_date
+        expiry_date = convert_date_format(str(row['Expiry_Date']))
+
+        cursor.execute(
+            """INSERT INTO food_listings 
+            (food_id, food_name, quantity, expiry_date, provider_id, provider_type, location, food_type, meal_type) 
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+            (row['Food_ID'], row['Food_Name'], row['Quantity'], expiry_date,
+             row['Provider_ID'], row['Provider_Type'], row['Location'],
+             row['Food_Type'], row['Meal_Type'])
+        )
+
+    # Load claims data
+    claims_df = pd.read_csv('claims_data.csv')
+    for _, row in claims_df.iterrows():
+        # Convert timestamp
+        timestamp = convert_timestamp_format(str(row['Timestamp']))
+
+        cursor.execute(
+            "INSERT INTO claims (claim_id, food_id, receiver_id, status, timestamp) VALUES (%s, %s, %s, %s, %s)",
+            (row['Claim_ID'], row['Food_ID'], row['Receiver_ID'], row['Status'], timestamp)
+        )
+
+
+# Optional connection pool, set up by long-running processes such as api.py
+connection_pool = None
+
+
 # Database connection
 def create_db_connection():
     try:
+        # Pooled connections go back to the pool when closed
+        if connection_pool:
+            return connection_pool.get_connection()
         connection = mysql.connector.connect(**DB_CONFIG)
         return connection
     except Error as e:
@@ -211,6 +456,383 @@ def execute_query(query, params=None, fetch=True):
     return None
 
 
+# Inventory ledger
+
+# Claim columns that only the ledger functions may change, read-only in editable_dataframe
+LEDGER_COLUMNS = {
+    'claims': ['food_id', 'quantity', 'status'],
+}
+
+
+def adjust_available(cursor, food_id, delta):
+    # Atomic counter increments; taking stock only succeeds while enough is available
+    if delta < 0:
+        cursor.execute("""
+            UPDATE food_inventory SET available_quantity = available_quantity + %s
+            WHERE food_id = %s AND available_quantity >= %s
+        """, (delta, food_id, -delta))
+    else:
+        cursor.execute("""
+            UPDATE food_inventory SET available_quantity = available_quantity + %s
+            WHERE food_id = %s
+        """, (delta, food_id))
+
+    if cursor.rowcount == 0:
+        return False
+    cursor.execute("UPDATE inventory_totals SET value = value + %s WHERE counter_name = 'available'", (delta,))
+    return True
+
+
+def record_inventory_event(cursor, food_id, claim_id, event, quantity):
+    cursor.execute(
+        "INSERT INTO inventory_ledger (food_id, claim_id, event, quantity) VALUES (%s, %s, %s, %s)",
+        (food_id, claim_id, event, quantity)
+    )
+
+
+def claim_reservation(cursor, claim_id):
+    # Units the ledger still holds reserved for a claim
+    cursor.execute("""
+        SELECT COALESCE(SUM(CASE event WHEN 'reserve' THEN quantity ELSE -quantity END), 0)
+        FROM inventory_ledger
+        WHERE claim_id = %s
+    """, (claim_id,))
+    return int(cursor.fetchone()[0])
+
+
+def create_claim(food_id, receiver_id, quantity):
+    connection = create_db_connection()
+    if not connection:
+        return None
+    cursor = connection.cursor()
+    try:
+        # Lock order is claims, food_listings, food_inventory. Listing updates lock
+        # food_listings before their triggers touch food_inventory, and the claim
+        # INSERT below would take this share lock anyway for its foreign key, only
+        # after the food_inventory lock.
+        cursor.execute("SELECT COALESCE(MAX(claim_id), 0) + 1 FROM claims FOR UPDATE")
+        claim_id = cursor.fetchone()[0]
+
+        cursor.execute("SELECT food_id FROM food_listings WHERE food_id = %s LOCK IN SHARE MODE", (food_id,))
+        if cursor.fetchone() is None:
+            connection.rollback()
+            st.error(f"Food ID {food_id} not found")
+            return None
+
+        # The conditional decrement means two receivers can never claim the same units
+        if not adjust_available(cursor, food_id, -quantity):
+            connection.rollback()
+            st.error(f"Not enough food available for food ID {food_id}")
+            return None
+
+        cursor.execute(
+            """INSERT INTO claims (claim_id, food_id, receiver_id, quantity, status, timestamp)
+            VALUES (%s, %s, %s, %s, 'Pending', NOW())""",
+            (claim_id, food_id, receiver_id, quantity)
+        )
+        record_inventory_event(cursor, food_id, claim_id, 'reserve', quantity)
+
+        connection.commit()
+        return claim_id
+    except Error as e:
+        connection.rollback()
+        st.error(f"Error creating claim: {e}")
+        return None
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def update_claim_status(claim_id, new_status):
+    connection = create_db_connection()
+    if not connection:
+        return False
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT food_id, quantity, status FROM claims WHERE claim_id = %s FOR UPDATE", (claim_id,))
+        claim = cursor.fetchone()
+        if claim is None or claim[2] != 'Pending':
+            connection.rollback()
+            st.error(f"Claim {claim_id} is not a pending claim")
+            return False
+        food_id, quantity, _ = claim
+        reserved = claim_reservation(cursor, claim_id)
+
+        if new_status == "Completed":
+            # Claims made before the ledger existed hold no reservation yet
+            if not reserved:
+                reserved = quantity
+                if not adjust_available(cursor, food_id, -reserved):
+                    connection.rollback()
+                    st.error(f"Not enough food available for food ID {food_id}")
+                    return False
+                record_inventory_event(cursor, food_id, claim_id, 'reserve', reserved)
+            record_inventory_event(cursor, food_id, claim_id, 'consume', reserved)
+        elif reserved:
+            adjust_available(cursor, food_id, reserved)
+            record_inventory_event(cursor, food_id, claim_id, 'release', reserved)
+
+        cursor.execute("UPDATE claims SET status = %s WHERE claim_id = %s", (new_status, claim_id))
+        connection.commit()
+        return True
+    except Error as e:
+        connection.rollback()
+        st.error(f"Error updating claim: {e}")
+        return False
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def delete_claim(claim_id):
+    connection = create_db_connection()
+    if not connection:
+        return False
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT food_id FROM claims WHERE claim_id = %s FOR UPDATE", (claim_id,))
+        claim = cursor.fetchone()
+        if claim is None:
+            connection.rollback()
+            st.error(f"Claim {claim_id} not found")
+            return False
+
+        # Give back whatever a pending claim still holds, so it does not leak
+        reserved = claim_reservation(cursor, claim_id)
+        if reserved:
+            adjust_available(cursor, claim[0], reserved)
+            record_inventory_event(cursor, claim[0], claim_id, 'release', reserved)
+
+        cursor.execute("DELETE FROM claims WHERE claim_id = %s", (claim_id,))
+        connection.commit()
+        return True
+    except Error as e:
+        connection.rollback()
+        st.error(f"Error deleting claim: {e}")
+        return False
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def create_claim_form(form_key):
+    with st.form(form_key):
+        food_id = st.number_input("Food ID", min_value=1, key=f"{form_key}_food_id")
+        receiver_id = st.number_input("Receiver ID", min_value=1, key=f"{form_key}_receiver_id")
+        quantity = st.number_input("Quantity", min_value=1, key=f"{form_key}_quantity")
+
+        if st.form_submit_button("Create Claim"):
+            new_claim_id = create_claim(food_id, receiver_id, quantity)
+            if new_claim_id:
+                st.success(f"Claim {new_claim_id} created for {quantity} units")
+                st.experimental_rerun()
+
+
+def rebuild_inventory_counters(connection):
+    try:
+        cursor = connection.cursor()
+
+        # Available = listed quantity - reserved + released; consumed units were reserved first
+        cursor.execute("DELETE FROM food_inventory")
+        cursor.execute("""
+            INSERT INTO food_inventory (food_id, available_quantity)
+            SELECT f.food_id, f.quantity - COALESCE(SUM(CASE l.event
+                WHEN 'reserve' THEN l.quantity
+                WHEN 'release' THEN -l.quantity
+                ELSE 0 END), 0)
+            FROM food_listings f
+            LEFT JOIN inventory_ledger l ON l.food_id = f.food_id
+            GROUP BY f.food_id, f.quantity
+        """)
+        cursor.execute("""
+            REPLACE INTO inventory_totals (counter_name, value)
+            SELECT 'available', COALESCE(SUM(available_quantity), 0) FROM food_inventory
+        """)
+
+        connection.commit()
+        return True
+    except Error as e:
+        connection.rollback()
+        st.error(f"Error rebuilding inventory counters: {e}")
+        return False
+    finally:
+        cursor.close()
+
+
+# Queries shared by the Streamlit pages and the JSON API (api.py)
+LISTINGS_QUERY = """
+    SELECT f.food_id, f.food_name, f.quantity, COALESCE(i.available_quantity, 0) as available_quantity,
+           f.expiry_date, f.food_type, f.meal_type, p.name as provider_name, p.city, p.contact
+    FROM food_listings f
+    JOIN providers p ON f.provider_id = p.provider_id
+    LEFT JOIN food_inventory i ON i.food_id = f.food_id
+    WHERE 1=1
+"""
+
+# Listing filter name -> filtered column
+LISTINGS_FILTERS = {
+    'city': 'p.city',
+    'food_type': 'f.food_type',
+    'meal_type': 'f.meal_type',
+}
+
+EXPIRING_SOON_QUERY = """
+    SELECT f.food_id, f.food_name, f.quantity, COALESCE(i.available_quantity, 0) as available_quantity,
+           f.expiry_date, p.name as provider_name, p.city
+    FROM food_listings f
+    JOIN providers p ON f.provider_id = p.provider_id
+    LEFT JOIN food_inventory i ON i.food_id = f.food_id
+    WHERE f.expiry_date BETWEEN CURDATE() AND DATE_ADD(CURDATE(), INTERVAL 3 DAY)
+"""
+
+CLAIMS_BY_STATUS_QUERY = """
+    SELECT c.claim_id, f.food_name, f.quantity, p.name as provider_name,
+           r.name as receiver_name, c.quantity as claimed_quantity, c.timestamp, c.status
+    FROM claims c
+    JOIN food_listings f ON c.food_id = f.food_id
+    JOIN providers p ON f.provider_id = p.provider_id
+    JOIN receivers r ON c.receiver_id = r.receiver_id
+    WHERE c.status = %s
+"""
+
+CITY_DISTRIBUTION_QUERY = """
+    SELECT p.city, SUM(COALESCE(i.available_quantity, 0)) as total_quantity
+    FROM food_listings f
+    JOIN providers p ON f.provider_id = p.provider_id
+    LEFT JOIN food_inventory i ON i.food_id = f.food_id
+    GROUP BY p.city
+"""
+
+
+def listings_filters(filters):
+    # Build the WHERE conditions for LISTINGS_QUERY, skipping filters set to "All"
+    clause, params = "", []
+    for name, column in LISTINGS_FILTERS.items():
+        value = filters.get(name)
+        if value and value != "All":
+            clause += f" AND {column} = %s"
+            params.append(value)
+    return clause, params
+
+
+# Chart data limits, so figures stay bounded whatever the data volume
+CHART_POINT_BUDGET = 500
+HISTOGRAM_BINS = 30
+
+# SQL expressions truncating a date/datetime column to the start of its bucket
+TIME_BUCKETS = {
+    'day': "DATE({column})",
+    'week': "DATE_SUB(DATE({column}), INTERVAL WEEKDAY({column}) DAY)",
+    'month': "DATE_SUB(DATE({column}), INTERVAL DAYOFMONTH({column}) - 1 DAY)",
+}
+
+
+def choose_time_granularity(start, end, budget=CHART_POINT_BUDGET):
+    # Finest granularity whose bucket count fits in the point budget
+    span_days = (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
+    if span_days <= budget:
+        return 'day'
+    if span_days / 7 <= budget:
+        return 'week'
+    return 'month'
+
+
+def lttb_downsample(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: returns the indices of the points to keep
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # First and last points are always kept, the rest is split into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    kept = np.empty(threshold, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            avg_x = x[edges[i + 1]:edges[i + 2]].mean()
+            avg_y = y[edges[i + 1]:edges[i + 2]].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) -
+                       (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        kept[i + 1] = a
+
+    return kept
+
+
+def time_series_chart_data(from_clause, column, aggregates, value_column, where=None, budget=CHART_POINT_BUDGET):
+    # Aggregate in SQL at a granularity picked from the date range, then downsample if still too large.
+    # from_clause is a table name or a whole FROM clause, joins included.
+    where_clause = f" WHERE {where}" if where else ""
+    bounds = execute_query(f"""
+        SELECT MIN({column}) as first_date, MAX({column}) as last_date
+        FROM {from_clause}{where_clause}
+    """)
+    if not bounds or bounds[0]['first_date'] is None:
+        return pd.DataFrame(), None
+
+    granularity = choose_time_granularity(bounds[0]['first_date'], bounds[0]['last_date'], budget)
+    bucket = TIME_BUCKETS[granularity].format(column=column)
+    series = execute_query(f"""
+        SELECT {bucket} as date, {aggregates}
+        FROM {from_clause}{where_clause}
+        GROUP BY date
+        ORDER BY date
+    """)
+
+    df = pd.DataFrame(series if series else [])
+    if len(df) > budget:
+        x = pd.to_datetime(df['date']).astype('int64')
+        y = pd.to_numeric(df[value_column], errors='coerce').fillna(0)
+        df = df.iloc[lttb_downsample(x, y, budget)].reset_index(drop=True)
+    return df, granularity
+
+
+def histogram_chart_data(source_query, column, bins=HISTOGRAM_BINS, integer_valued=False):
+    # Bin a numeric column of a query in SQL, returning one row per non-empty bin.
+    # Bounds come from window functions, so the source query only runs once.
+    span = f"(MAX({column}) OVER () - MIN({column}) OVER ())"
+    if integer_valued:
+        # Whole-number widths, so every bin covers the same count of possible values.
+        # That can give one bin more than `bins`, clipping would merge values into the last one.
+        width = f"GREATEST(1, CEIL({span} / %s))"
+        bin_index = f"FLOOR(({column} - low) / width)"
+        params = (bins,)
+    else:
+        width = f"IF({span} = 0, 1, {span} / %s)"
+        bin_index = f"LEAST(FLOOR(({column} - low) / width), %s)"
+        params = (bins - 1, bins)
+
+    binned = execute_query(f"""
+        SELECT {bin_index} as bin, COUNT(*) as count,
+               MIN(low) as low, MIN(width) as width
+        FROM (
+            SELECT {column}, MIN({column}) OVER () as low, {width} as width
+            FROM ({source_query}) as source
+            WHERE {column} IS NOT NULL
+        ) as ranged
+        GROUP BY bin
+        ORDER BY bin
+    """, params)
+    if not binned:
+        return pd.DataFrame(), None
+
+    df = pd.DataFrame(binned)
+    low, width = float(df['low'].iloc[0]), float(df['width'].iloc[0])
+    df['bin'] = df['bin'].astype(int)
+    df['bin_start'] = low + df['bin'] * width
+    df[column] = df['bin_start'] + width / 2
+    return df.drop(columns=['low', 'width']), width
+
+
 # Display dataset with editing capability
 def editable_dataframe(table_name, key_columns):
     query = f"SELECT * FROM {table_name}"
@@ -227,8 +849,13 @@ def editable_dataframe(table_name, key_columns):
         # Edit form
         with st.expander(f"Edit {table_name}"):
             edit_option = st.radio("Edit Option", ["Add New", "Update Existing", "Delete"], key=f"edit_{table_name}")
+            ledger_columns = LEDGER_COLUMNS.get(table_name, [])
 
-            if edit_option == "Add New":
+            if edit_option == "Add New" and table_name == 'claims':
+                # New claims reserve stock, so they go through the ledger
+                create_claim_form(f"add_{table_name}")
+
+            elif edit_option == "Add New":
                 with st.form(f"add_{table_name}"):
                     new_data = {}
                     for col in df.columns:
@@ -261,6 +888,9 @@ def editable_dataframe(table_name, key_columns):
                     for col in df.columns:
                         if col in key_columns:
                             update_data[col] = record_id
+                        elif col in ledger_columns:
+                            # Only the ledger functions may change these
+                            continue
                         elif df[col].dtype == 'int64':
                             update_data[col] = st.number_input(f"New {col}", value=int(selected_record[col]),
                                                                min_value=0)
@@ -303,9 +933,13 @@ def editable_dataframe(table_name, key_columns):
                     record_id = st.selectbox(f"Select {key_columns[0]} to delete", df[key_columns[0]].tolist())
 
                     if st.form_submit_button("Delete Record"):
-                        where_clause = ' AND '.join([f"{col} = %s" for col in key_columns])
-                        query = f"DELETE FROM {table_name} WHERE {where_clause}"
-                        if execute_query(query, (record_id,), fetch=False):
+                        if table_name == 'claims':
+                            deleted = delete_claim(record_id)
+                        else:
+                            where_clause = ' AND '.join([f"{col} = %s" for col in key_columns])
+                            query = f"DELETE FROM {table_name} WHERE {where_clause}"
+                            deleted = execute_query(query, (record_id,), fetch=False)
+                        if deleted:
                             st.success("Record deleted successfully!")
                             st.experimental_rerun()
 
@@ -354,14 +988,11 @@ def editable_dataframe(table_name, key_columns):
             st.plotly_chart(fig1, use_container_width=True)
 
             # Claims over time
-            claims_over_time = execute_query("""
-                SELECT DATE(timestamp) as date, COUNT(*) as count 
-                FROM claims 
-                GROUP BY DATE(timestamp) 
-                ORDER BY date
-            """)
-            if claims_over_time:
-                fig2 = px.line(claims_over_time, x='date', y='count', title='Claims Over Time')
+            claims_over_time, granularity = time_series_chart_data(
+                'claims', 'timestamp', "COUNT(*) as count", 'count')
+            if not claims_over_time.empty:
+                fig2 = px.line(claims_over_time, x='date', y='count',
+                               title=f'Claims Over Time (per {granularity})')
                 st.plotly_chart(fig2, use_container_width=True)
 
 
@@ -389,7 +1020,7 @@ def main():
         col1, col2, col3 = st.columns(3)
 
         # Total food available
-        total_food = execute_query("SELECT SUM(quantity) as total FROM food_listings")
+        total_food = execute_query("SELECT value as total FROM inventory_totals WHERE counter_name = 'available'")
         col1.metric("Total Food Available", f"{total_food[0]['total']} units" if total_food else "N/A")
 
         # Total providers
@@ -403,9 +1034,11 @@ def main():
         # Recent food listings
         st.subheader("Recent Food Listings")
         recent_listings = execute_query("""
-            SELECT f.food_id, f.food_name, f.quantity, f.expiry_date, p.name as provider_name, p.city 
+            SELECT f.food_id, f.food_name, f.quantity, COALESCE(i.available_quantity, 0) as available_quantity,
+                   f.expiry_date, p.name as provider_name, p.city
             FROM food_listings f
             JOIN providers p ON f.provider_id = p.provider_id
+            LEFT JOIN food_inventory i ON i.food_id = f.food_id
             ORDER BY f.expiry_date ASC
             LIMIT 10
         """)
@@ -424,13 +1057,7 @@ def main():
 
         # Expiring soon food items
         st.subheader("Food Expiring Soon (Next 3 Days)")
-        expiring_soon = execute_query("""
-            SELECT f.food_id, f.food_name, f.quantity, f.expiry_date, p.name as provider_name, p.city
-            FROM food_listings f
-            JOIN providers p ON f.provider_id = p.provider_id
-            WHERE f.expiry_date BETWEEN CURDATE() AND DATE_ADD(CURDATE(), INTERVAL 3 DAY)
-            ORDER BY f.expiry_date ASC
-        """)
+        expiring_soon = execute_query(EXPIRING_SOON_QUERY + " ORDER BY f.expiry_date ASC, f.food_id ASC")
         st.dataframe(pd.DataFrame(expiring_soon if expiring_soon else []))
 
     elif choice == "Food Listings":
@@ -448,28 +1075,12 @@ def main():
         meal_type_filter = col3.selectbox("Filter by Meal Type", ["All"] + meal_types)
 
         # Build query
-        query = """
-            SELECT f.food_id, f.food_name, f.quantity, f.expiry_date, f.food_type, f.meal_type, 
-                   p.name as provider_name, p.city, p.contact
-            FROM food_listings f
-            JOIN providers p ON f.provider_id = p.provider_id
-            WHERE 1=1
-        """
-        params = []
-
-        if city_filter != "All":
-            query += " AND p.city = %s"
-            params.append(city_filter)
-
-        if food_type_filter != "All":
-            query += " AND f.food_type = %s"
-            params.append(food_type_filter)
-
-        if meal_type_filter != "All":
-            query += " AND f.meal_type = %s"
-            params.append(meal_type_filter)
-
-        query += " ORDER BY f.expiry_date ASC"
+        clause, params = listings_filters({
+            'city': city_filter,
+            'food_type': food_type_filter,
+            'meal_type': meal_type_filter,
+        })
+        query = LISTINGS_QUERY + clause + " ORDER BY f.expiry_date ASC, f.food_id ASC"
 
         # Display filtered results
         filtered_listings = execute_query(query, params if params else None)
@@ -486,18 +1097,14 @@ def main():
 
         with tab1:
             st.subheader("Pending Claims")
-            pending_claims = execute_query("""
-                SELECT c.claim_id, f.food_name, f.quantity, p.name as provider_name, 
-                       r.name as receiver_name, c.timestamp
-                FROM claims c
-                JOIN food_listings f ON c.food_id = f.food_id
-                JOIN providers p ON f.provider_id = p.provider_id
-                JOIN receivers r ON c.receiver_id = r.receiver_id
-                WHERE c.status = 'Pending'
-                ORDER BY c.timestamp ASC
-            """)
+            pending_claims = execute_query(CLAIMS_BY_STATUS_QUERY + " ORDER BY c.timestamp ASC, c.claim_id ASC",
+                                           ('Pending',))
             st.dataframe(pd.DataFrame(pending_claims if pending_claims else []))
 
+            # New claim, reserving part of a listing
+            st.subheader("Create Claim")
+            create_claim_form("create_claim")
+
             # Update claim status
             st.subheader("Update Claim Status")
             with st.form("update_claim"):
@@ -505,54 +1112,20 @@ def main():
                 new_status = st.selectbox("New Status", ["Completed", "Cancelled"])
 
                 if st.form_submit_button("Update Status"):
-                    update_result = execute_query("""
-                        UPDATE claims SET status = %s WHERE claim_id = %s
-                    """, (new_status, claim_id), fetch=False)
-
-                    if update_result:
+                    if update_claim_status(claim_id, new_status):
                         st.success(f"Claim {claim_id} updated to {new_status}")
-                        if new_status == "Completed":
-                            # Reduce food quantity
-                            execute_query("""
-                                UPDATE food_listings 
-                                SET quantity = quantity - (
-                                    SELECT quantity FROM food_listings 
-                                    WHERE food_id = (
-                                        SELECT food_id FROM claims WHERE claim_id = %s
-                                    )
-                                )
-                                WHERE food_id = (
-                                    SELECT food_id FROM claims WHERE claim_id = %s
-                                )
-                            """, (claim_id, claim_id), fetch=False)
-                            st.experimental_rerun()
+                        st.experimental_rerun()
 
         with tab2:
             st.subheader("Completed Claims")
-            completed_claims = execute_query("""
-                SELECT c.claim_id, f.food_name, f.quantity, p.name as provider_name, 
-                       r.name as receiver_name, c.timestamp
-                FROM claims c
-                JOIN food_listings f ON c.food_id = f.food_id
-                JOIN providers p ON f.provider_id = p.provider_id
-                JOIN receivers r ON c.receiver_id = r.receiver_id
-                WHERE c.status = 'Completed'
-                ORDER BY c.timestamp DESC
-            """)
+            completed_claims = execute_query(CLAIMS_BY_STATUS_QUERY + " ORDER BY c.timestamp DESC, c.claim_id DESC",
+                                             ('Completed',))
             st.dataframe(pd.DataFrame(completed_claims if completed_claims else []))
 
         with tab3:
             st.subheader("Cancelled Claims")
-            cancelled_claims = execute_query("""
-                SELECT c.claim_id, f.food_name, f.quantity, p.name as provider_name, 
-                       r.name as receiver_name, c.timestamp, c.status
-                FROM claims c
-                JOIN food_listings f ON c.food_id = f.food_id
-                JOIN providers p ON f.provider_id = p.provider_id
-                JOIN receivers r ON c.receiver_id = r.receiver_id
-                WHERE c.status = 'Cancelled'
-                ORDER BY c.timestamp DESC
-            """)
+            cancelled_claims = execute_query(CLAIMS_BY_STATUS_QUERY + " ORDER BY c.timestamp DESC, c.claim_id DESC",
+                                             ('Cancelled',))
             st.dataframe(pd.DataFrame(cancelled_claims if cancelled_claims else []))
 
         # CRUD operations for claims
@@ -573,6 +1146,14 @@ def main():
         elif dataset == "claims":
             editable_dataframe("claims", ["claim_id"])
 
+        # Recompute available quantities from the inventory ledger
+        if st.button("Rebuild Inventory Counters"):
+            connection = create_db_connection()
+            if connection:
+                if rebuild_inventory_counters(connection):
+                    st.success("Inventory counters rebuilt from the ledger")
+                connection.close()
+
     elif choice == "Advanced Analytics":
         st.header("📈 Advanced Analytics")
 
@@ -588,13 +1169,7 @@ def main():
 
         if analysis_option == "Food Distribution by City":
             st.subheader("Food Distribution by City")
-            food_by_city = execute_query("""
-                SELECT p.city, SUM(f.quantity) as total_quantity
-                FROM food_listings f
-                JOIN providers p ON f.provider_id = p.provider_id
-                GROUP BY p.city
-                ORDER BY total_quantity DESC
-            """)
+            food_by_city = execute_query(CITY_DISTRIBUTION_QUERY + " ORDER BY total_quantity DESC, p.city ASC")
             if food_by_city:
                 fig = px.bar(food_by_city, x='city', y='total_quantity',
                              title='Total Food Available by City')
@@ -650,10 +1225,9 @@ def main():
             st.subheader("Top Receivers by Food Claims")
             top_receivers = execute_query("""
                 SELECT r.name, COUNT(c.claim_id) as total_claims, 
-                       SUM(f.quantity) as total_quantity
+                       SUM(c.quantity) as total_quantity
                 FROM claims c
                 JOIN receivers r ON c.receiver_id = r.receiver_id
-                JOIN food_listings f ON c.food_id = f.food_id
                 WHERE c.status = 'Completed'
                 GROUP BY r.name
                 ORDER BY total_claims DESC
@@ -667,44 +1241,45 @@ def main():
 
         elif analysis_option == "Food Wastage Trends":
             st.subheader("Food Wastage Trends")
-            wastage_trends = execute_query("""
-                SELECT 
-                    DATE(expiry_date) as date,
-                    SUM(quantity) as total_quantity,
-                    COUNT(*) as item_count
-                FROM food_listings
-                WHERE expiry_date < CURDATE()
-                GROUP BY DATE(expiry_date)
-                ORDER BY date
-            """)
-
-            if wastage_trends:
+            # Units consumed by completed claims were not wasted
+            wastage_trends, granularity = time_series_chart_data(
+                """food_listings f
+                LEFT JOIN (
+                    SELECT food_id, SUM(quantity) as consumed
+                    FROM inventory_ledger
+                    WHERE event = 'consume'
+                    GROUP BY food_id
+                ) l ON l.food_id = f.food_id""", 'f.expiry_date',
+                "SUM(f.quantity - COALESCE(l.consumed, 0)) as total_quantity, COUNT(*) as item_count",
+                'total_quantity', where="f.expiry_date < CURDATE()")
+
+            if not wastage_trends.empty:
                 fig = px.line(wastage_trends, x='date', y='total_quantity',
-                              title='Expired Food Quantity Over Time')
+                              title=f'Expired Food Quantity Over Time (per {granularity})')
                 st.plotly_chart(fig, use_container_width=True)
             else:
                 st.info("No expired food data available")
 
         elif analysis_option == "Claim Processing Time":
             st.subheader("Claim Processing Time Analysis")
-            processing_time = execute_query("""
-                SELECT 
+            processing_time, bin_width = histogram_chart_data("""
+                SELECT
                     c.claim_id,
-                    TIMESTAMPDIFF(HOUR, c.timestamp, 
-                        (SELECT MIN(c2.timestamp) 
-                         FROM claims c2 
-                         WHERE c2.food_id = c.food_id 
-                         AND c2.status = 'Completed' 
+                    TIMESTAMPDIFF(HOUR, c.timestamp,
+                        (SELECT MIN(c2.timestamp)
+                         FROM claims c2
+                         WHERE c2.food_id = c.food_id
+                         AND c2.status = 'Completed'
                          AND c2.timestamp > c.timestamp)) as hours_to_complete
                 FROM claims c
                 WHERE c.status = 'Pending'
                 HAVING hours_to_complete IS NOT NULL
-                ORDER BY hours_to_complete
-            """)
+            """, 'hours_to_complete', integer_valued=True)
 
-            if processing_time:
-                fig = px.histogram(pd.DataFrame(processing_time), x='hours_to_complete',
-                                   title='Distribution of Claim Processing Times (Hours)')
+            if not processing_time.empty:
+                fig = px.bar(processing_time, x='hours_to_complete', y='count',
+                             title='Distribution of Claim Processing Times (Hours)')
+                fig.update_traces(width=bin_width)
                 st.plotly_chart(fig, use_container_width=True)
             else:
                 st.info("No completed claims data available for analysis")